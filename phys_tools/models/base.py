@@ -4,6 +4,7 @@ import tables as tb
 from abc import ABC, abstractmethod
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
 from scipy.stats import norm
 import numba as nb
 import os
@@ -174,17 +175,17 @@ class Unit(ABC):
         """
         nstarts = len(t_0s_ms)
         spiketimes = []
-        spiketrials = []
+        counts = np.empty(nstarts, dtype=np.int64)
         start_times_ms = t_0s_ms - pre_ms
         size = pre_ms + post_ms
         for i in range(nstarts):
             st = start_times_ms[i]
             t0 = t_0s_ms[i]
             spike_sub = self.get_epoch_ms(st, st + size) - t0  # everything here is float or at least signed.
-            spiketrials.extend([i] * len(spike_sub))
+            counts[i] = len(spike_sub)
             spiketimes.append(spike_sub)
         spiketimes = np.concatenate(spiketimes)
-        spiketrials = np.array(spiketrials)
+        spiketrials = np.repeat(np.arange(nstarts, dtype=np.int64), counts)
         shape = (nstarts, (-pre_ms, post_ms))
         return spiketrials, spiketimes, shape  # these are in milliseconds!!
 
@@ -418,6 +419,25 @@ def _autocorrelation(spiketimes, bin_edges, ):
     return bins
 
 
+@nb.njit(parallel=True, nogil=True, cache=True)
+def _gather_sniff(sniff, t_0s, pre, out):
+    """
+    Fills out[i] with the sniff samples around t_0s[i] (window implied by out's width).
+    Indexes are clamped to the trace bounds for windows at the edges of the recording.
+    """
+    n_samps = out.shape[1]
+    last = sniff.size - 1
+    for i in nb.prange(t_0s.size):
+        st = t_0s[i] - pre
+        for j in range(n_samps):
+            k = st + j
+            if k < 0:
+                k = 0
+            elif k > last:
+                k = last
+            out[i, j] = sniff[k]
+
+
 class Session(ABC):
     """
     Hello!
@@ -624,6 +644,9 @@ class Session(ABC):
     def sniff(self) -> np.array:
         """
         loads all sniff samples from the session meta file.
+
+        The trace is read from HDF5 once and cached on the session, so repeated
+        plotting calls don't reopen the file.
         """
         if self._sniff is None:
             with tb.open_file(self.paths['meta'], 'r') as f:
@@ -642,18 +665,14 @@ class Session(ABC):
 
         pre_samps, post_samps = self.millis_to_samples((pre_ms, post_ms))
 
-        if np.isscalar(t_0s):
-            n_sniffs = 1
-            t_0s = np.array([t_0s])
-        else:
-            n_sniffs = len(t_0s)
+        # asarray is zero-copy when the caller already passes an int64 ndarray (the
+        # usual path from get_first_odor_sniffs); scalars become a 1-element array.
+        t_0s = np.atleast_1d(np.asarray(t_0s, dtype=np.int64))
         sniff = self.sniff
-        sniff_mat = np.zeros((n_sniffs, int(pre_samps + post_samps)), dtype=sniff.dtype)
-        for i in range(n_sniffs):
-            t = t_0s[i]
-            st = int(t - pre_samps)
-            nd = int(t + post_samps)
-            sniff_mat[i, :] = sniff[st:nd]
+        # the gather runs in a parallel numba kernel; window size is usually constant
+        # across calls, so the compile cost is paid once per session.
+        sniff_mat = np.empty((t_0s.size, int(pre_samps) + int(post_samps)), dtype=sniff.dtype)
+        _gather_sniff(sniff, t_0s, int(pre_samps), sniff_mat)
         return sniff_mat
 
     def plot_sniffs(self, t_0s, pre_ms, post_ms, axis=None, color='b', alpha=1., linewidth=2, linestyle='-'):
@@ -675,9 +694,13 @@ class Session(ABC):
         x = np.linspace(-pre_ms, post_ms, num=len(sniffs.T))
         if axis is None:
             axis = plt.axes() # type: Axes
-        for i in range(len(sniffs)):
-            axis.plot(x, sniffs[i, :], color=color, linestyle=linestyle, linewidth=linewidth, alpha=alpha)
-        axis.plot([0] * 2, plt.ylim(), '--k', linewidth=1)
+        # all traces go into one LineCollection: one artist and one draw call instead of
+        # a Line2D per sniff.
+        segs = np.stack((np.broadcast_to(x, sniffs.shape), sniffs), axis=-1)
+        axis.add_collection(LineCollection(segs, colors=color, linestyles=linestyle,
+                                           linewidths=linewidth, alpha=alpha))
+        axis.autoscale_view()
+        axis.plot([0] * 2, axis.get_ylim(), '--k', linewidth=1)
         return axis
 
 
@@ -2,6 +2,7 @@ from .base import Session, Unit
 from ..utils import meta_loaders
 import tables as tb
 import numpy as np
+import numba as nb
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
 
@@ -108,9 +109,9 @@ class OdorUnit(Unit):
             order = np.argsort(diffs_ms)
             inhs_ms, exhs_ms = [x[order] for x in (inhs_ms, exhs_ms)]
             diffs_ms_ordered = diffs_ms[order]
-            points = [(0, 1)]  # start at trial 1, not 0 consistent with how we're plotting the rasters.
-            points.extend([(diffs_ms_ordered[x], x + 1) for x in range(n_tr)])
-            points.append((0, n_tr))
+            # start at trial 1, not 0 consistent with how we're plotting the rasters.
+            mid = np.column_stack((diffs_ms_ordered, np.arange(1, n_tr + 1)))
+            points = np.vstack(([[0, 1]], mid, [[0, n_tr]]))
             poly = Polygon(points, color='g', alpha=.25)
             # TODO: polygon is having trouble covering the points of trial 1. not sure why.
         rasters = self.get_rasters_ms(inhs_ms, pre_ms, post_ms)
@@ -150,26 +151,107 @@ class OdorUnit(Unit):
             inhs, exhs, diffs = [x[sort_indexes] for x in (inhs, exhs, diffs)]
         scalars = diffs.mean() / diffs
         pre, post = self.session.millis_to_samples((pre_ms, post_ms))
-        allspikes = []
-        alltrials = []
-        for i in range(ntrials):
-            t_0 = inhs[i] # + self.session.millis_to_samples(50.)
-            st = t_0 - pre  # constant.
-            s = scalars[i]
-            spikes = (self.get_epoch_samples(st, t_0 + post / s) - st).astype(
-                float)  # subtract start before converting from uint to not lose precision
-            spikes -= pre  # subtract to get negative pre-t0 times AFTER conversion to float because uint will break
-            spikes[spikes > 0] *= s  # scaling floats is right thing to do here.
-            allspikes.append(spikes)
-            alltrials.extend([i] * len(spikes))  # start at trial '1'
-        allspikes = np.concatenate(allspikes)
-        alltrials = np.array(alltrials)
+        starts = inhs - pre
+        ends = inhs + post / scalars
+        # two vectorized binary searches bound every trial's spikes at once instead of
+        # one get_epoch_samples call (and mask) per trial.
+        spikes = self.spiketimes
+        # an early first inhalation can put starts before sample 0; clip before the uint64 cast,
+        # which would otherwise wrap negatives to huge values.
+        i_st = np.searchsorted(spikes, np.clip(starts, 0, None).astype(np.uint64), side='left')
+        i_nd = np.searchsorted(spikes, np.clip(ends, 0, None).astype(np.uint64), side='right')
+        counts = (i_nd - i_st).astype(np.int64)
+        all_raw = np.concatenate([spikes[l:h] for l, h in zip(i_st, i_nd)]).astype(np.float64)
+        allspikes = _warp_spiketimes(all_raw, counts, np.asarray(starts, dtype=np.float64),
+                                     float(pre), np.asarray(scalars, dtype=np.float64))
+        alltrials = np.repeat(np.arange(ntrials, dtype=np.int64), counts)
         allspikes_ms = self.session.samples_to_millis(allspikes)
         shape = ntrials, (-pre_ms, post_ms)
         return self.plot_rasters((alltrials, allspikes_ms, shape), axis=axis, quick_plot=quick_plot,
                                  color=color, alpha=alpha, offset=offset, markersize=markersize)
 
 
+@nb.njit((nb.float64[::1], nb.int64[::1], nb.float64[::1], nb.float64, nb.float64[::1]),
+         cache=True)
+def _warp_spiketimes(spiketimes, counts, starts, pre, scalars):
+    """
+    Warps concatenated per-trial spiketimes in one compiled pass.
+
+    Subtracts each trial's start and the pre period, then scales post-t0 times by the
+    trial's scalar. counts[i] gives the number of spikes belonging to trial i.
+    """
+    warped = np.empty(spiketimes.size, dtype=np.float64)
+    k = 0
+    for i in range(counts.size):
+        for _ in range(counts[i]):
+            v = spiketimes[k] - starts[i] - pre
+            if v > 0:
+                v *= scalars[i]
+            warped[k] = v
+            k += 1
+    return warped
+
+
+@nb.njit((nb.int64[::1], nb.int64[::1], nb.int64[::1], nb.int64[::1]), cache=True)
+def _scan_sniff_windows(fv_ons, fv_offs, inhales, exhales):
+    """
+    Finds the inhalations/exhalations falling within each final valve open period.
+
+    Returns CSR-style flat arrays with offsets for both event types, plus the first
+    inhalation and exhalation of each stim (-1 when the stim has no complete sniff).
+    The scan for all stims runs in one compiled pass over the sorted event arrays.
+    """
+    n = fv_ons.size
+    inh_lo = np.empty(n, dtype=np.int64)
+    inh_hi = np.empty(n, dtype=np.int64)
+    exh_lo = np.empty(n, dtype=np.int64)
+    exh_hi = np.empty(n, dtype=np.int64)
+    n_inh = 0
+    n_exh = 0
+    for i in range(n):
+        lo = np.searchsorted(inhales, fv_ons[i], side='right')
+        hi = np.searchsorted(inhales, fv_offs[i], side='left')
+        if hi < lo:
+            hi = lo
+        elo = 0
+        ehi = 0
+        if hi > lo:
+            first_inh = inhales[lo]  # sorted, so the window's first element is its min.
+            elo = np.searchsorted(exhales, first_inh, side='right')
+            if elo < exhales.size:
+                ehi = min(elo + (hi - lo) + 1, exhales.size)  # n inhales == n exhales
+            else:
+                elo = 0
+        inh_lo[i], inh_hi[i] = lo, hi
+        exh_lo[i], exh_hi[i] = elo, ehi
+        n_inh += hi - lo
+        n_exh += ehi - elo
+
+    inh_flat = np.empty(n_inh, dtype=np.int64)
+    exh_flat = np.empty(n_exh, dtype=np.int64)
+    inh_offsets = np.empty(n + 1, dtype=np.int64)
+    exh_offsets = np.empty(n + 1, dtype=np.int64)
+    first_inhs = np.full(n, -1, dtype=np.int64)
+    first_exhs = np.full(n, -1, dtype=np.int64)
+    inh_offsets[0] = 0
+    exh_offsets[0] = 0
+    ki = 0
+    ke = 0
+    for i in range(n):
+        for j in range(inh_lo[i], inh_hi[i]):
+            inh_flat[ki] = inhales[j]
+            ki += 1
+        for j in range(exh_lo[i], exh_hi[i]):
+            exh_flat[ke] = exhales[j]
+            ke += 1
+        inh_offsets[i + 1] = ki
+        exh_offsets[i + 1] = ke
+        if inh_hi[i] > inh_lo[i] and exh_hi[i] > exh_lo[i]:
+            first_inhs[i] = inhales[inh_lo[i]]
+            first_exhs[i] = exhales[exh_lo[i]]
+    return inh_flat, inh_offsets, exh_flat, exh_offsets, first_inhs, first_exhs
+
+
 class OdorSession(Session):
     unit_type = OdorUnit
 
@@ -178,6 +260,7 @@ class OdorSession(Session):
         self._odors = None
         self._unique_concs = None
         self._concentrations_by_odor = None
+        self._first_sniff_cache = {}  # (odor, concentration) -> (inhs, exhs), shared across units.
 
     def _make_stimuli(self, meta_file: tb.File) -> dict:
         """
@@ -195,8 +278,6 @@ class OdorSession(Session):
 
         # building lists of stimulus attributes. Doing this because masking is easy/efficient with np arrays.
         odors_by_stim = []
-        inhales_by_stim = []
-        exhales_by_stim = []
         finalvalve_on_times = []
         finalvalve_off_times = []
         concentrations_by_stim = []
@@ -221,62 +302,92 @@ class OdorSession(Session):
             else:
                 odor = 'blank'
             cs = tr[ODOR_CONC_FIELD]
-            fv_starts_trial_mask = (fv_starts > st) & (fv_starts < nd)
-            if fv_starts_trial_mask.any():
+            # valve times are sorted, so two binary searches find the openings in this
+            # trial without building (and reducing) a mask over all of them.
+            i_fv_st = np.searchsorted(fv_starts, st, side='right')
+            i_fv_nd = np.searchsorted(fv_starts, nd, side='left')
+            if i_fv_nd > i_fv_st:
                 # if there is no final valve opening, we don't want to add anything to the stim dictionary.
-                if fv_starts_trial_mask.sum() > 1:
+                if i_fv_nd - i_fv_st > 1:
                     print('warning, there are more than 1 final valve openings in trial.')
                 # we're taking only the first fvon, any additional are due to trial numbering problems.
-                fvon = fv_starts[fv_starts_trial_mask][0]
-                fvoff = fv_ends[fv_ends > fvon][0]  # first end following start is the end.
-                # process inhalations and exhalations falling within the stimulus time period.
-                inhs_fv = np.array([])
-                exhs_fv = np.array([])
-                inhale_mask_fv = ((self.inhales > fvon) & (self.inhales < fvoff))
-                if inhale_mask_fv.any():
-                    inhs_fv = self.inhales[inhale_mask_fv]
-                    inh_idxes = np.where(inhale_mask_fv)[0]
-                    first_inh, last_inh = inhs_fv.min(), inhs_fv.max()
-                    num_inhs = len(inh_idxes)
-                    exh_mask = self.exhales > first_inh
-                    if exh_mask.any():
-                        first_exh_idx = np.where(exh_mask)[0][0]
-                        last_exh_idx = min((first_exh_idx + num_inhs + 1, len(self.exhales)))
-                        exhs_fv = self.exhales[first_exh_idx:last_exh_idx]  # n inhales == n exhales
-
+                fvon = fv_starts[i_fv_st]
+                fvoff = fv_ends[np.searchsorted(fv_ends, fvon, side='right')]  # first end following start is the end.
                 # these appends only happen if FV opening is detected:
-                inhales_by_stim.append(inhs_fv)
-                exhales_by_stim.append(exhs_fv)
                 finalvalve_on_times.append(fvon)
                 finalvalve_off_times.append(fvoff)
                 odors_by_stim.append(odor)
                 concentrations_by_stim.append(cs)
 
+        # all sniff windows are extracted in one compiled pass over the sorted event
+        # arrays. Per-stim events come back CSR-style: one flat array plus offsets, so
+        # stim i's events are the contiguous slice flat[offsets[i]:offsets[i+1]].
+        (inhales_flat, inhales_offsets, exhales_flat, exhales_offsets,
+         first_inhs, first_exhs) = _scan_sniff_windows(
+            np.asarray(finalvalve_on_times, dtype=np.int64),
+            np.asarray(finalvalve_off_times, dtype=np.int64),
+            np.asarray(self.inhales, dtype=np.int64),
+            np.asarray(self.exhales, dtype=np.int64))
+
+        # odor strings are matched constantly downstream; encode them once as int codes
+        # into a sorted label table so the matching runs on the integer path.
+        odor_labels, odor_codes = np.unique(odors_by_stim, return_inverse=True)
+
         result = {
             'fv_ons': np.array(finalvalve_on_times),
             'fv_offs': np.array(finalvalve_off_times),
             'odors': np.array(odors_by_stim),
+            'odor_labels': odor_labels,
+            'odor_codes': odor_codes.astype(np.int64),
             'odorconcs': np.array(concentrations_by_stim),
-            'inhales': np.array(inhales_by_stim),
-            'exhales': np.array(exhales_by_stim)
+            'inhales_flat': inhales_flat,
+            'inhales_offsets': inhales_offsets,
+            'exhales_flat': exhales_flat,
+            'exhales_offsets': exhales_offsets,
+            'first_inhs': first_inhs,
+            'first_exhs': first_exhs
         }
         return result
 
+    def stim_inhales(self, i: int) -> np.array:
+        """
+        Returns the inhalation times occurring during stimulus i as a zero-copy slice.
+        """
+        offsets = self.stimuli['inhales_offsets']
+        return self.stimuli['inhales_flat'][offsets[i]:offsets[i + 1]]
+
+    def stim_exhales(self, i: int) -> np.array:
+        """
+        Returns the exhalation times occurring during stimulus i as a zero-copy slice.
+        """
+        offsets = self.stimuli['exhales_offsets']
+        return self.stimuli['exhales_flat'][offsets[i]:offsets[i + 1]]
+
     @property
     def unique_odors(self) -> np.array:
         """
         Returns all unique_odors found within the session.
         """
         if self._odors is None:
-            self._odors = np.unique(self.stimuli['odors'])
+            self._odors = self.stimuli['odor_labels']  # already unique and sorted.
         return self._odors
 
+    def _odor_code(self, odor: str) -> int:
+        """
+        Returns the integer code for an odor name, or -1 if it was not presented.
+        """
+        labels = self.stimuli['odor_labels']
+        i = np.searchsorted(labels, odor)
+        if i < len(labels) and labels[i] == odor:
+            return i
+        return -1
+
     def get_concentrations(self, odor: str) -> np.array:
         """
         Returns a sorted array of unique concentrations presented for a specified odorant.
         """
 
-        mask = self.stimuli["odors"] == odor
+        mask = self.stimuli["odor_codes"] == self._odor_code(odor)
         concs = self.stimuli["odorconcs"][mask]
         return np.unique(concs)
 
@@ -294,24 +405,26 @@ class OdorSession(Session):
 
         :param odor: string specifying odor
         :param concentration: numeric specifying concentration of odor.
-        :return: tuple (inhalations, exhalations) of arrays.
+        :return: tuple (inhalations, exhalations) of arrays. Arrays are cached and read-only.
         """
 
-        odors = self.stimuli['odors']
+        key = (odor, concentration)
+        if key in self._first_sniff_cache:
+            # every unit in the session asks for the same conditions, so memoize.
+            return self._first_sniff_cache[key]
         concs = self.stimuli['odorconcs']
-        inhales = self.stimuli['inhales']
-        exhales = self.stimuli['exhales']
-        odormask = odors == odor
-        concmask = concs == concentration
-        allmask = odormask & concmask
-        idxes = np.where(allmask)[0]
-        first_inhs, first_exhs = [], []
-        for i in idxes:
-            inhs, exhs = inhales[i], exhales[i]
-            if len(inhs) and len(exhs):
-                first_inhs.append(inhs[0])
-                first_exhs.append(exhs[0])
-        return np.array(first_inhs), np.array(first_exhs)
+        first_inhs = self.stimuli['first_inhs']
+        first_exhs = self.stimuli['first_exhs']
+        # accumulate the conditions into one mask in place rather than allocating a
+        # boolean temporary per comparison. Matching runs on int codes, not strings.
+        mask = self.stimuli['odor_codes'] == self._odor_code(odor)
+        mask &= concs == concentration
+        mask &= first_inhs >= 0  # sentinel -1 marks stims without complete sniffs.
+        inhs, exhs = first_inhs[mask], first_exhs[mask]
+        inhs.setflags(write=False)  # cached arrays are shared, so guard against mutation.
+        exhs.setflags(write=False)
+        self._first_sniff_cache[key] = (inhs, exhs)
+        return inhs, exhs
 
     def plot_odor_sniffs(self, odor: str, conc, pre_ms, post_ms, axis=None, separate_plots=False, color='b', alpha=1.,
                          linewidth=2, linestyle='-', ):
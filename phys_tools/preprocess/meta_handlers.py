@@ -3,12 +3,90 @@ import logging
 import numpy as np
 from scipy.optimize import minimize
 from scipy.stats import norm
-from tqdm import tqdm, trange
 import numba as nb
 
 MAX_N = 30000
 MAX_TRIGGERS = 30000
 
+# streams shorter than this aren't worth the thread fan-out of the parallel scan kernel.
+PARALLEL_SCAN_MIN = 1 << 22
+
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def _compress_transitions(set_mask, clear_mask):
+    """
+    Two-pass count-then-fill compression of the samples where either mask is set: each thread
+    counts its block, block offsets come from a prefix sum, and the threads then fill their
+    slices of the output in parallel. Returns (indices, set_mask values at those indices).
+    """
+    n = set_mask.size
+    nblk = nb.get_num_threads()
+    blk = (n + nblk - 1) // nblk
+    counts = np.zeros(nblk + 1, np.int64)
+    for b in nb.prange(nblk):
+        st = b * blk
+        nd = min(st + blk, n)
+        c = 0
+        for i in range(st, nd):
+            if set_mask[i] or clear_mask[i]:
+                c += 1
+        counts[b + 1] = c
+    for b in range(nblk):
+        counts[b + 1] += counts[b]
+    t = np.empty(counts[nblk], np.int64)
+    m = np.empty(counts[nblk], np.bool_)
+    for b in nb.prange(nblk):
+        pos = counts[b]
+        st = b * blk
+        nd = min(st + blk, n)
+        for i in range(st, nd):
+            if set_mask[i] or clear_mask[i]:
+                t[pos] = i
+                m[pos] = set_mask[i]
+                pos += 1
+    return t, m
+
+
+def _int_thresholds(stream, threshold):
+    """
+    Coerces a (usually float) threshold into the stream's integer dtype so the compares stay in
+    that dtype instead of promoting the whole scan to float64. For integer x, x > t is exactly
+    x > floor(t) and x < t is exactly x < ceil(t), so the pair (floor, ceil) preserves the
+    original crossing semantics. Float streams pass the threshold through unchanged.
+
+    :return: (above_threshold, below_threshold) for use as `stream > above` / `stream < below`.
+    """
+    if np.issubdtype(stream.dtype, np.integer):
+        return stream.dtype.type(np.floor(threshold)), stream.dtype.type(np.ceil(threshold))
+    return threshold, threshold
+
+
+def _scan_latched_pairs(set_mask, clear_mask):
+    """
+    Vectorized set/reset latch over a stream: the state turns on at a sample where set_mask is
+    true, off at the next sample where clear_mask is true, and holds where neither is. Samples
+    with neither mask set are compressed out, so the remaining transitions are just the rising
+    and falling edges of the compressed boolean mask (branchless compares, no per-sample loop).
+
+    :param set_mask: boolean array, true where the state may turn on.
+    :param clear_mask: boolean array, true where the state may turn off.
+    :return: (start_indices, stop_indices); a trailing start with no stop is not returned.
+
+    The starts and stops are kept as separate contiguous arrays here (and in the detectors'
+    intermediate work); callers pack them into the (n, 2) table that the meta file stores only
+    at the very end, since that's the layout downstream loaders read.
+    """
+    if set_mask.size >= PARALLEL_SCAN_MIN:
+        t, m = _compress_transitions(set_mask, clear_mask)
+    else:
+        t = np.flatnonzero(set_mask | clear_mask)
+        m = set_mask[t]
+    rises = np.flatnonzero(m[1:] & ~m[:-1]) + 1
+    falls = np.flatnonzero(m[:-1] & ~m[1:]) + 1
+    if m.size and m[0]:
+        rises = np.concatenate(([0], rises))
+    return t[rises], t[falls]
+
 def _parse_serial(serial_stream, fs=25000., word_len=2, baudrate=300, threshold=None):
     """
 
@@ -149,7 +227,6 @@ def parse_serial_stream(stream, fs=25000):
     return trial_times
 
 
-# @jit(cache=True)
 def findfvopens(stream, *args, threshold=None):
     """
     This very simplistic. Uses threshold value equal to stream.mean() unless you specify a threshold.
@@ -158,28 +235,17 @@ def findfvopens(stream, *args, threshold=None):
     :param threshold: threshold value.
     :return:
     """
-    fv = np.zeros((MAX_TRIGGERS,2), dtype=np.uint64)
-    fv_starts = fv[:,0]
-    fv_stops = fv[:,1]
-    nstarts = 0
-    fvopen = False
-    lastopen = np.uint64(0)
     if threshold is None:
         threshold = np.mean(stream)
-    nstops = 0
-
-    for i in tqdm(range(len(stream)), unit='samp', desc='FV scan'):
-        val = stream[i]
-        if not fvopen and val > threshold and (val - lastopen > 500):
-            fv_starts[nstarts] = i
-            nstarts+=1
-            fvopen = True
-        elif fvopen and val < threshold:
-            fv_stops[nstops] = i
-            nstops += 1
-            fvopen = False
-    if nstops:
-        return fv[:nstops,:]
+    th_above, th_below = _int_thresholds(stream, threshold)
+    # the scan this replaces also gated opens on val > 500 (its lastopen baseline never moved
+    # from zero); keep that gate.
+    starts, stops = _scan_latched_pairs((stream > th_above) & (stream > 500), stream < th_below)
+    if len(stops):
+        fv = np.empty((len(stops), 2), dtype=np.uint64)
+        fv[:, 0] = starts[:len(stops)]
+        fv[:, 1] = stops
+        return fv
     else:
         return np.array([], dtype=np.uint64)
 
@@ -322,52 +388,21 @@ def laseronsets(stream, *args):
     :param threshold: threshold value if you want to force it.
     :return: array shape (n laser ons, 2) with the first column being laser ons and the second column being offs
     """
-    lsr = np.zeros((MAX_TRIGGERS, 2), dtype=np.uint32)  # big enough for 1.6 days of recordings...
-    # lsr_starts = lsr[:, 0]
-    # lsr_stops = lsr[:, 1]
-    # nstarts = 0
-    # lsr_on = False
-    # laston = np.uint64(0)
-
     r = stream.max() - stream.min()
     threshold = stream.min() + r/2.
-    # nstops = 0
 
-    # for i in trange(len(stream), unit='samp', desc='laser scan', unit_scale=True):
-    #     val = stream[i]
-    #     if not lsr_on and val > threshold and (val - laston > 500):
-    #         lsr_starts[nstarts] = i
-    #         nstarts += 1
-    #         lsr_on = True
-    #     elif lsr_on and val < threshold:
-    #         lsr_stops[nstops] = i
-    #         nstops += 1
-    #         lsr_on = False
-
-    n_pulses = _findonsets(stream, lsr, threshold)
+    th_above, th_below = _int_thresholds(stream, threshold)
+    starts, stops = _scan_latched_pairs(stream > th_above, stream < th_below)
+    n_pulses = len(stops)
 
     if n_pulses:
-        return lsr[:n_pulses, :]
+        lsr = np.empty((n_pulses, 2), dtype=np.uint32)
+        lsr[:, 0] = starts[:n_pulses]
+        lsr[:, 1] = stops
+        return lsr
     else:
         return np.array([], dtype=np.uint64)
 
-@nb.jit
-def _findonsets(stream, out, threshold):
-    n_pulses = 0
-    lsr_on = False
-    # laston = np.uint64(0)
-
-    for i in range(len(stream)):
-        val = stream[i]
-        if not lsr_on and val > threshold:
-            lsr_on = True
-            out[n_pulses, 0] = i
-        elif lsr_on and val < threshold:
-            out[n_pulses, 1] = i
-            n_pulses += 1
-            lsr_on = False
-    return n_pulses
-
 
 
 def dmd_frames(stream, fs=30000):
@@ -1,6 +1,8 @@
 import numpy as np
-from numba import jit
+import numba as nb
+import functools
 import os
+import re
 from scipy.signal import decimate, butter, filtfilt
 import tables as tb
 import shutil
@@ -15,10 +17,7 @@ import pickle
 import warnings
 from typing import Iterable, Dict
 from collections import defaultdict
-try:
-    import matplotlib.pyplot as plt
-except RuntimeError:
-    pass
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 LOG_FORMATTER = logging.Formatter("%(asctime)s %(levelname)-7.7s:  %(message)s")
 LOGGER = logging.getLogger()
@@ -28,12 +27,34 @@ console_handler.setFormatter(LOG_FORMATTER)
 LOGGER.addHandler(console_handler)
 
 EXPECTED_LFP_ROWS = 1800000  # number lfp samples per channel for openphys LFP file (30 min @ 1kHz)
+
+
+def _plt():
+    """matplotlib is only needed for debug plots; import it lazily so module import doesn't pay
+    for it (or fail without a display)."""
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _save_debug_plot(plt, title):
+    """Saves the current debug figure to the working directory instead of blocking on show()."""
+    plt.title(title)
+    fn = title.replace(' ', '_') + '.png'
+    plt.savefig(fn)
+    plt.close()
+    logging.info('Debug plot saved to {}'.format(fn))
 STREAM_PLOT_NSAMP = 100000
 EVENT_PLOT_NSAMP = 1000000
+MAX_PLOT_PTS = 4096  # debug plots stride down to about this many points; screens have no more pixels.
 
-# The filter below is used to compress stream data in the meta.h5 file. It is chosen for maximum compatibility.
-STREAM_FILTER = tb.Filters(complevel=6, complib='zlib', shuffle=True)
-LFP_FILTER = tb.Filters(complevel=6, complib='zlib', shuffle=True)
+# The filters below compress stream data in the meta.h5 and lfp.h5 files. blosc's shuffled lz4
+# compresses int16 signals nearly as well as zlib at a fraction of the CPU cost on both ends.
+STREAM_FILTER = tb.Filters(complevel=3, complib='blosc:lz4', shuffle=True)
+LFP_FILTER = tb.Filters(complevel=3, complib='blosc:lz4', shuffle=True)
+# event tables are small (n, 2) index arrays; a light lz4 pass with shuffle still ~4x's them.
+EVENT_FILTERS = tb.Filters(complevel=1, complib='blosc:lz4', shuffle=True)
+EVENT_CHUNK_ROWS = 1 << 16
+LFP_CHUNKSHAPE = (131072,)  # ~2 min of 1 kHz LFP per HDF5 chunk; default chunks are far smaller.
 
 
 def process_spikegl_recording(raw_fn_list: list,
@@ -95,13 +116,15 @@ def process_spikegl_recording(raw_fn_list: list,
             if not os.path.exists(f):
                 raise FileNotFoundError('{} not found.'.format(f))
 
+    # outputs are written as .partial siblings of the final names and renamed on success; the
+    # temp directory only holds the small per-run meta-channel binaries.
     tmpdirname = 'tmp-{}'.format(uuid4())
     dat_fn = "{}.dat".format(save_prefix)
-    temp_dat_fn = os.path.join(tmpdirname, dat_fn)
+    temp_dat_fn = dat_fn + '.partial'
     lfp_fn = '{}_lfp.h5'.format(save_prefix)
-    temp_lfp_fn = os.path.join(tmpdirname, '{}_lfp.h5'.format(save_prefix))
-    temp_meta_fn = os.path.join(tmpdirname, '{}_meta.h5'.format(save_prefix))
+    temp_lfp_fn = lfp_fn + '.partial'
     meta_fn = '{}_meta.h5'.format(save_prefix)
+    temp_meta_fn = meta_fn + '.partial'
     separated_prefixes = []
 
     for fnn in (dat_fn, lfp_fn, meta_fn):
@@ -141,7 +164,6 @@ def process_spikegl_recording(raw_fn_list: list,
             m_fn = meta_fns[i]
             if not r_fn[0] == m_fn[0]:
                 logging.warning('raw and meta filenames are not similar: raw: {}, meta: {}'.format(r_fn, m_fn))
-            logging.info('Separating {} to channels...'.format(r_fn))
             chs, fs, _ = _read_sgl_meta(m_fn)
             for ch in neural_channel_numbers:
                 if ch not in chs:
@@ -151,16 +173,29 @@ def process_spikegl_recording(raw_fn_list: list,
                     if v not in chs:
                         raise ValueError('Channel {} specified as a meta channel "{}", but not found '
                                          'in recording.'.format(v, k))
-            _separate_channels(r_fn, chs, separated_prefix, dtype=file_dtype)
+
+            # the dat layout is the same interleaved layout as the raw bin, so append the raw bytes
+            # directly instead of demuxing to per-channel files and merging them back together.
+            logging.info('Appending {} to dat: {}...'.format(r_fn, temp_dat_fn))
+            with open(temp_dat_fn, 'ab') as dst, open(r_fn, 'rb') as src:
+                shutil.copyfileobj(src, dst, 2 ** 24)
+            logging.info('Write complete.')
+
+            # PL validation, LFP extraction and meta channels all work from memmapped columns of
+            # the raw file; only the handful of meta channels still get their own .bin files.
+            run_data = np.memmap(r_fn, dtype=file_dtype, mode='r').reshape(-1, len(chs))
+            meta_chs = set(meta_event_dict.values()) | set(meta_stream_dict.values())
+            for ch in sorted(meta_chs):
+                _dump_raw(_gen_channel_fn(separated_prefix, ch), run_data[:, chs.index(ch)])
 
             if pl_trig_ch:
                 logging.info('Running PL removal using ch {}...'.format(pl_trig_ch))
-                pl_sig = np.fromfile(_gen_channel_fn(separated_prefix, pl_trig_ch), file_dtype)
+                pl_sig = np.ascontiguousarray(run_data[:, chs.index(pl_trig_ch)])
                 if debug_plots and i < 1:
+                    plt = _plt()
                     plt.plot(pl_sig[:10000])
                     plt.plot(plt.xlim(), [pl_sig.mean()]*2, '--k')
-                    plt.title('PL trig debug plot')
-                    plt.show()
+                    _save_debug_plot(plt, 'PL trig debug plot')
                 pl_trig_times = _find_pl_times(pl_sig)
 
                 # if there's greater that 20% error in the number of PL trigs compared to what we expect,
@@ -173,17 +208,14 @@ def process_spikegl_recording(raw_fn_list: list,
             else:
                 print('No PL trigger channel specified, skipping removal step.')
 
-            logging.info('Merging neural channels to dat: {}...'.format(temp_dat_fn))
-            with open(temp_dat_fn, 'ab') as f:
-                _merge_channels(separated_prefix, chs, f, dtype=file_dtype)
-                logging.info('Write complete.')
-
             if i < 1:
                 create_lfp_file = True
             else:
                 create_lfp_file = False
             _make_lfp(separated_prefix, neural_channel_numbers, temp_lfp_fn, fs, create_lfp_file,
-                      dtype=file_dtype, expectedrows=samps_per_ch)
+                      dtype=file_dtype, expectedrows=samps_per_ch,
+                      channel_data={ch: run_data[:, chs.index(ch)] for ch in neural_channel_numbers})
+            del run_data
 
         make_meta_from_bins(separated_prefixes, meta_stream_dict, meta_event_dict, voyeur_fns, temp_meta_fn, fs,
                             file_dtype, debug_plots)
@@ -198,9 +230,13 @@ def process_spikegl_recording(raw_fn_list: list,
     except Exception as e:
         logging.exception("message")
     finally:
-        if clean_on_excemption and os.path.exists(tmpdirname):
-            logging.info('Cleaning up temp files...')
-            shutil.rmtree(tmpdirname)
+        if clean_on_excemption:
+            if os.path.exists(tmpdirname):
+                logging.info('Cleaning up temp files...')
+                shutil.rmtree(tmpdirname)
+            for fnn in (temp_dat_fn, temp_lfp_fn, temp_meta_fn):  # no-ops after a clean rename.
+                if os.path.exists(fnn):
+                    os.remove(fnn)
         elif os.path.exists(tmpdirname):
             logging.info('clean_on_exception=False, leaving temp directory.')
         LOGGER.removeHandler(log_file_handler)
@@ -222,7 +258,8 @@ def process_oEphys_rec(open_ephys_recording_folder,
                        clean_on_exemption=True,
                        process_aux=True,
                        process_neural=True,
-                       process_lfp=True
+                       process_lfp=True,
+                       channel_major=False
                        ):
     """
     Preprocessing script for electrophysiology data.
@@ -249,6 +286,9 @@ def process_oEphys_rec(open_ephys_recording_folder,
     :param clean_on_exemption: Should we delete everything if the routine fails?
     :param process_aux: Do you want to make a meta file?
     :param process_neural: Do you want to extract spiketimes?
+    :param channel_major: write the dat with each channel contiguous (within a run) instead of
+    interleaved. Per-channel consumers read sequentially from this layout; use reinterleave_dat
+    to produce the sample-major file spike sorters expect.
     :return:
     """
     file_dtype = np.dtype(file_dtype)
@@ -329,9 +369,9 @@ def process_oEphys_rec(open_ephys_recording_folder,
                     plfn = raw_adc_fns[plid]
                     pl_sig = loadContinuous(plfn, dtype=file_dtype)['data']
                     if debug_plots and i_run < 1:
+                        plt = _plt()
                         plt.plot(pl_sig[:10000])
-                        plt.title('PL trig debug plot')
-                        plt.show()
+                        _save_debug_plot(plt, 'PL trig debug plot')
                     pl_trig_times = _find_pl_times(pl_sig)
 
                     logging.debug('{} pl trig times found'.format(len(pl_trig_times)))
@@ -340,19 +380,25 @@ def process_oEphys_rec(open_ephys_recording_folder,
                         logging.warning('PL trig channel specified as AUX {}, '
                                         'but this file not found.'.format(pl_trig_ch))
                     logging.info('No PL trig removal. Writing temporary dat files...')
-                for i_ch in tqdm(neural_channel_numbers, unit='chan', desc='Unpack/PL filter'):
-                    save_fn = _gen_channel_fn(separated_prefix, i_ch)
-                    raw_fn = raw_neural_fns[raw_neural_chs.index(i_ch)]
-                    loaded = loadContinuous(raw_fn, dtype=file_dtype)
-                    a = loaded['data']
-                    n_samples_by_ch.append(len(a))
-                    if not fs:
-                        # TODO keep track of number of samples in recording
-                        fs = int(loaded['header']['sampleRate'])
-                    if pl_trig_ch and pl_trig_ch in raw_adc_chs:
-                        _rm_pl_i(a, pl_trig_times)
-                    with open(save_fn, 'wb') as f:
-                        a.tofile(f)
+                # channels are unpacked on worker threads: the .continuous decode is a vectorized
+                # frombuffer pass and the PL kernels are nogil, so threads genuinely overlap —
+                # and forking worker processes after numba's parallel threading layer has
+                # initialized (which importing this module does) hangs the interpreter at exit.
+                pl_times = pl_trig_times if pl_trig_ch and pl_trig_ch in raw_adc_chs else None
+                ch_raw_fns = [raw_neural_fns[raw_neural_chs.index(i_ch)]
+                              for i_ch in neural_channel_numbers]
+                ch_save_fns = [_gen_channel_fn(separated_prefix, i_ch)
+                               for i_ch in neural_channel_numbers]
+                n_jobs = len(ch_raw_fns)
+                with ThreadPoolExecutor(max_workers=min(n_jobs, os.cpu_count() or 1)) as ex:
+                    results = ex.map(_unpack_neural_channel, ch_raw_fns, ch_save_fns,
+                                     [file_dtype] * n_jobs, [pl_times] * n_jobs)
+                    for n_samps, ch_fs in tqdm(results, total=n_jobs, unit='chan',
+                                               desc='Unpack/PL filter'):
+                        n_samples_by_ch.append(n_samps)
+                        if not fs:
+                            # TODO keep track of number of samples in recording
+                            fs = ch_fs
 
                 #note: dat file will only have neural channels. Aux channels will not be added to the dat
                 total_neural_samples = 0  # sum of samples in all neural channels
@@ -370,7 +416,14 @@ def process_oEphys_rec(open_ephys_recording_folder,
                 logging.info('Neural channels extracted at {} hz'.format(fs))
                 logging.info('Writing to {}...'.format(temp_dat_fn))
                 with open(temp_dat_fn, 'ab') as f:
-                    _merge_channels(separated_prefix, neural_channel_numbers, f, dtype=file_dtype)
+                    if channel_major:
+                        # channels are already separate files, so the wide layout is a straight
+                        # concatenation — no interleaving pass at all.
+                        for i_ch in neural_channel_numbers:
+                            with open(_gen_channel_fn(separated_prefix, i_ch), 'rb') as src:
+                                shutil.copyfileobj(src, f, 2 ** 24)
+                    else:
+                        _merge_channels(separated_prefix, neural_channel_numbers, f, dtype=file_dtype)
                     logging.info('Complete.')
 
                 assert os.path.getsize(temp_dat_fn) == total_expected_dat_size
@@ -401,8 +454,7 @@ def process_oEphys_rec(open_ephys_recording_folder,
                     logging.debug('saving ADC ch {} ({}) to "{}"'.format(ch, raw_fn, save_fn))
                     loaded = loadContinuous(raw_fn, dtype=file_dtype)
                     a = loaded['data']
-                    with open(save_fn, 'wb') as f:
-                        a.tofile(f)
+                    _dump_raw(save_fn, a)
                     if not fs:
                         fs = int(loaded['header']['sampleRate'])
 
@@ -502,6 +554,43 @@ def process_wavesurfer_rec(
     log_file_handler.close()
 
 
+def _dump_raw(path, arr):
+    """
+    Writes an array's raw bytes to path with os.write, bypassing buffered stdio and its extra
+    full-array copy.
+
+    :param path: output file path (created/truncated).
+    :param arr: array to dump; made contiguous if it is a strided view.
+    """
+    mv = memoryview(np.ascontiguousarray(arr)).cast('B')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        n = 0
+        while n < len(mv):
+            n += os.write(fd, mv[n:])
+    finally:
+        os.close(fd)
+
+
+def _unpack_neural_channel(raw_fn, save_fn, file_dtype, pl_trig_times):
+    """
+    Decodes one openephys .continuous file, optionally removes the PL template, and dumps the
+    signal to save_fn. Runs on a worker thread.
+
+    :param raw_fn: path to the .continuous file.
+    :param save_fn: path for the flat binary output.
+    :param file_dtype: dtype for the decoded signal.
+    :param pl_trig_times: PL edge index array, or None to skip removal.
+    :return: (number of samples, sample rate from the file header)
+    """
+    loaded = loadContinuous(raw_fn, dtype=file_dtype)
+    a = loaded['data']
+    if pl_trig_times is not None:
+        _rm_pl_i(a, pl_trig_times)
+    _dump_raw(save_fn, a)
+    return len(a), int(loaded['header']['sampleRate'])
+
+
 def _find_juxta_spikes(neural_signal: np.ndarray, fs: float, threshold_sd=5., lowcut=300., highcut=3000., debug_plots=True) -> np.ndarray:
     """
     Filter and find threshold crossings. Threshold is expressed in terms of standard deviations from mean.
@@ -520,15 +609,16 @@ def _find_juxta_spikes(neural_signal: np.ndarray, fs: float, threshold_sd=5., lo
     filtered = filtfilt(b, a, neural_signal)  # zero phase delay.
     threshold = filtered.std() * threshold_sd
     if debug_plots:
+        plt = _plt()
         plt.plot(filtered[:int(fs)], label='signal')
         plt.plot(plt.xlim(),[threshold] * 2, '--r', alpha=.7, label='threshold {:0.1f}'.format(threshold_sd))
         plt.legend(loc='best')
-        plt.title('neural channel excerpt')
-        plt.show()
+        _save_debug_plot(plt, 'neural channel excerpt')
     thresholded = filtered > threshold
     crossings, = np.where(np.convolve([1,-1], thresholded, 'valid') == 1)
 
     if debug_plots:
+        plt = _plt()
         pad = int(fs/1000.)
 
         amplitudes = np.zeros(len(crossings), dtype=filtered.dtype)
@@ -543,8 +633,7 @@ def _find_juxta_spikes(neural_signal: np.ndarray, fs: float, threshold_sd=5., lo
         plt.ylabel('spike amplitude')
         plt.xlabel('recording time (s)')
         plt.legend(loc='best')
-        plt.title('spike amplitude over time')
-        plt.show()
+        _save_debug_plot(plt, 'spike amplitude over time')
 
         x = np.linspace(-1, 1, pad * 2)
         for i in range(0, len(crossings), 50):
@@ -552,9 +641,8 @@ def _find_juxta_spikes(neural_signal: np.ndarray, fs: float, threshold_sd=5., lo
             st = int(c - pad)
             nd = int(c + pad)
             plt.plot(x, filtered[st:nd], alpha=.3)
-        plt.title('waveforms')
         plt.xlabel('time (ms)')
-        plt.show()
+        _save_debug_plot(plt, 'waveforms')
 
     return crossings
 
@@ -578,34 +666,30 @@ def resume(resume_file_path):
                         file_dtype, debug_plots)
 
 
+@functools.lru_cache(maxsize=None)
 def _read_sgl_meta(path):
     """
-    Reads SpikeGL meta file. Returns list of channel numbers in the order they are recorded and the sample rate of the
-    acquisition system.[[
+    Reads SpikeGL meta file. Returns tuple of channel numbers in the order they are recorded and the sample rate of the
+    acquisition system. Results are cached by path, since each meta file is parsed once for the
+    size/channel-count check and again inside the per-run loop.
 
     :param path: path to the .meta file
     :return:
     """
-    a = open(path)
-    b = a.read()
-    meta = dict()
-    for i in b.splitlines():
-        k, vals = i.split('=')
-        meta[k] = vals
+    with open(path) as f:
+        meta = dict(line.split('=', 1) for line in f.read().splitlines() if '=' in line)
     channels = []
     chstr = meta['snsSaveChanSubset']
     if chstr == 'all':
-        channels = [x for x in range(256)]
-    # print (channels)
+        channels = list(range(256))
     else:
         for i in chstr.split(','):
             if ':' in i:
-                low, high = [int(x) for x in i.split(':')]
-                high += 1
-                for ii in range(low, high):
-                    channels.append(ii)
+                low, high = (int(x) for x in i.split(':'))
+                channels.extend(range(low, high + 1))
             else:
                 channels.append(int(i))
+    channels = tuple(channels)  # immutable, so the cached value can't be mutated by callers.
     fs = int(meta['niSampRate'])
     logging.debug('n channels: {}'.format(len(channels)))
     logging.debug(str(channels))
@@ -641,41 +725,79 @@ def _separate_channels(raw_fn, channels, prefix_str, overwrite=False, append=Fal
             if os.path.exists(fn):
                 raise ValueError('Files already exist, set overwrite flag if needed.')
 
-    if not append:
-        with open(fn, 'wb') as f:
-            pass
-    elif append:
+    if append:
         sizes = [os.path.getsize(x) for x in channel_fns]
         assert len(set(sizes)) == 1
 
     bytes_per_sample = dtype.itemsize
-
     total_bytes = os.path.getsize(raw_fn)
-    samples_per_read -= samples_per_read % n_ch
-    bytes_per_read = samples_per_read * bytes_per_sample
-    n_steps = int(np.ceil(total_bytes / bytes_per_read))
-
     assert not total_bytes % (bytes_per_sample * n_ch)
 
-    step_count = 0
-    with open(raw_fn, 'rb') as orig_file:
-        a = np.fromfile(orig_file, dtype, samples_per_read)
-        x = len(a)
-        while x:
-            step_count += 1
-            logging.info('Separating block {} of {}.'.format(step_count, n_steps))
-            a.shape = int(a.size / n_ch), n_ch
-            for i, fn in enumerate(channel_fns):
-                with open(fn, 'ab') as f:
-                    a[:, i].tofile(f)
-            # load next block and repeat if it exists.
-            a = np.fromfile(orig_file, dtype, samples_per_read)
-            x = len(a)
+    # memmap the interleaved file instead of re-reading it into memory; the OS pages in only the
+    # rows we touch, and one transpose per block gives every channel a contiguous slab to write.
+    raw = np.memmap(raw_fn, dtype=dtype, mode='r')
+    raw = raw.reshape(-1, n_ch)
+    n_rows = raw.shape[0]
+    rows_per_block = max(samples_per_read // n_ch, 1)
+    n_steps = int(np.ceil(n_rows / rows_per_block))
+
+    # two fixed transpose buffers (one being written, one being prefetched) so no block
+    # allocates a fresh array.
+    block_buffers = [np.empty((n_ch, rows_per_block), dtype=dtype) for _ in range(2)]
+
+    def _load_block(step):
+        rows = raw[step * rows_per_block:(step + 1) * rows_per_block]
+        block = block_buffers[step % 2][:, :rows.shape[0]]
+        np.copyto(block, rows.T)
+        return block
+
+    mode = 'ab' if append else 'wb'
+    channel_files = [open(fn, mode) for fn in channel_fns]
+    try:
+        # double-buffer: a single prefetch worker pages in and transposes block n+1 while block n
+        # is being written, overlapping read and write I/O.
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            pending = prefetch.submit(_load_block, 0)
+            for step in range(n_steps):
+                logging.info('Separating block {} of {}.'.format(step + 1, n_steps))
+                block = pending.result()
+                if step + 1 < n_steps:
+                    pending = prefetch.submit(_load_block, step + 1)
+                for i, f in enumerate(channel_files):
+                    block[i].tofile(f)
+    finally:
+        for f in channel_files:
+            f.close()
+        del raw
+
 
 
+def reinterleave_dat(channel_major_fn, n_channels, save_fn, samples_per_block=10**7,
+                     dtype=np.dtype('int16')):
+    """
+    Converts a channel-major dat (written by process_oEphys_rec with channel_major=True) into the
+    interleaved sample-major dat that spike sorters expect, one transposed block at a time.
+
+    :param channel_major_fn: path to the channel-major binary.
+    :param n_channels: number of channels in the file.
+    :param save_fn: path for the interleaved output.
+    :param samples_per_block: samples (across all channels) held in memory per block.
+    :param dtype: datatype of the binary.
+    :return:
+    """
+    wide = np.memmap(channel_major_fn, dtype=dtype, mode='r').reshape(n_channels, -1)
+    cols_per_block = max(samples_per_block // n_channels, 1)
+    with open(save_fn, 'wb') as f:
+        for st in range(0, wide.shape[1], cols_per_block):
+            np.ascontiguousarray(wide[:, st:st + cols_per_block].T).tofile(f)
+    del wide
 
+
+@functools.lru_cache(maxsize=None)
 def _gen_channel_fn(prefix, channel_number):
     """
+    Cached: each (prefix, channel) path is formatted once and reused across the separate,
+    merge and meta loops.
 
     :param prefix:
     :param channel_number:
@@ -685,6 +807,27 @@ def _gen_channel_fn(prefix, channel_number):
     return '{0}_ch{1:04n}.bin'.format(prefix, channel_number)
 
 
+def _sizes_by_scandir(paths):
+    """
+    Stats many files with one directory scan per parent instead of a stat syscall per file —
+    scandir batches the metadata, which matters on networked filesystems.
+
+    :param paths: iterable of file paths.
+    :return: list of file sizes in the order of paths.
+    """
+    by_dir = defaultdict(set)
+    for p in paths:
+        d, b = os.path.split(p)
+        by_dir[d or '.'].add(b)
+    sizes = {}
+    for d, names in by_dir.items():
+        with os.scandir(d) as it:
+            for entry in it:
+                if entry.name in names:
+                    sizes[(d, entry.name)] = entry.stat().st_size
+    return [sizes[(os.path.split(p)[0] or '.', os.path.split(p)[1])] for p in paths]
+
+
 def _merge_channels(separate_prefix, channels, save_file_obj, samples_per_read=10 ** 8,
                     dtype=np.int16):
     """
@@ -698,30 +841,133 @@ def _merge_channels(separate_prefix, channels, save_file_obj, samples_per_read=1
     """
 
     fns = [_gen_channel_fn(separate_prefix, x) for x in channels]
-    sizes = [os.path.getsize(x) for x in fns]
+    sizes = _sizes_by_scandir(fns)
     assert len(set(sizes)) == 1
     bytes_per = dtype.itemsize
 
-    stepsize_samps = samples_per_read // len(channels)
+    n_ch = len(channels)
+    stepsize_samps = samples_per_read // n_ch
     stepsize_bytes = stepsize_samps * bytes_per
     n_bytes = sizes[0]
-    temp_array = np.zeros((stepsize_samps, len(channels)), dtype=dtype)
-    seek = 0
+    block_buffers = [np.empty((n_ch, stepsize_samps), dtype=dtype) for _ in range(2)]
+    channel_views = [[memoryview(row).cast('B') for row in buf] for buf in block_buffers]
+    interleave_buffers = [np.empty((stepsize_samps, n_ch), dtype=dtype) for _ in range(2)]
     n_steps = int(np.ceil(n_bytes / stepsize_bytes))
 
-    for _ in tqdm(range(n_steps), unit='block', desc='Merge to DAT'):
-        if seek < n_bytes:
-            for i, fn in enumerate(fns):
-                with open(fn, 'rb') as f:
-                    f.seek(seek)
-                    a = np.fromfile(f, dtype, stepsize_samps)
-                    temp_array[:len(a), i] = a
-            temp_array[:len(a), :].tofile(save_file_obj)
-            seek += stepsize_bytes
+    # each channel file is opened once for the whole merge and hinted for sequential readahead.
+    # per block, all channels are read concurrently with positioned preads into preallocated
+    # buffer rows, so the drive sees n_ch requests in flight instead of serialized reads. two
+    # buffers alternate so a prefetch worker can read block n+1 while block n is written out.
+    channel_files = [open(fn, 'rb', buffering=0) for fn in fns]
+    try:
+        if hasattr(os, 'posix_fadvise'):
+            for f in channel_files:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        fds = [f.fileno() for f in channel_files]
+        with ThreadPoolExecutor(max_workers=min(n_ch, os.cpu_count() or 1)) as read_pool, \
+                ThreadPoolExecutor(max_workers=1) as prefetch:
+            def _read_block(step):
+                offset = step * stepsize_bytes
+                reads = read_pool.map(_pread_full, fds, channel_views[step % 2], [offset] * n_ch)
+                return min(reads) // bytes_per
+            pending = prefetch.submit(_read_block, 0)
+            for step in tqdm(range(n_steps), unit='block', desc='Merge to DAT'):
+                n_samps = pending.result()
+                if step + 1 < n_steps:
+                    pending = prefetch.submit(_read_block, step + 1)
+                if n_samps:
+                    interleaved = interleave_buffers[step % 2][:n_samps]
+                    np.copyto(interleaved, block_buffers[step % 2][:, :n_samps].T)
+                    interleaved.tofile(save_file_obj)
+    finally:
+        for f in channel_files:
+            f.close()
     return
 
 
-@jit  # you need this.
+def _readinto_full(f, view):
+    """
+    Reads from file f into the buffer view until it is full or EOF; returns bytes read.
+    """
+    total = 0
+    while total < len(view):
+        n = f.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+if hasattr(os, 'preadv'):
+    def _pread_full(fd, view, offset):
+        """
+        Positioned read from fd into the buffer view until it is full or EOF; returns bytes read.
+        """
+        total = 0
+        while total < len(view):
+            n = os.preadv(fd, [view[total:]], offset + total)
+            if not n:
+                break
+            total += n
+        return total
+else:
+    def _pread_full(fd, view, offset):
+        """
+        Positioned read for platforms without os.preadv (macOS, Windows): os.pread where it
+        exists, else seek+read — safe here because each fd is only read by one thread at a time.
+        Fills the buffer view until full or EOF; returns bytes read.
+        """
+        pread = getattr(os, 'pread', None)
+        total = 0
+        while total < len(view):
+            if pread is not None:
+                b = pread(fd, len(view) - total, offset + total)
+            else:
+                os.lseek(fd, offset + total, os.SEEK_SET)
+                b = os.read(fd, len(view) - total)
+            if not b:
+                break
+            view[total:total + len(b)] = b
+            total += len(b)
+        return total
+
+
+@nb.njit([(nb.int16[::1], nb.int64[::1], nb.int64, nb.int64[::1]),
+          (nb.uint16[::1], nb.int64[::1], nb.int64, nb.int64[::1])],
+         parallel=True, nogil=True, cache=True)
+def _pl_accumulate(chan_sig, edges, pl_len, acc):
+    """
+    Sums the raw signal across PL cycles into the int64 accumulator acc (length pl_len).
+    Parallel over template samples, since adjacent cycles can overlap.
+    """
+    for j in nb.prange(pl_len):
+        s = 0
+        for i in range(edges.size):
+            s += chan_sig[edges[i] + j]
+        acc[j] += s
+
+
+@nb.njit([(nb.int16[::1], nb.int64[::1], nb.int32[::1], nb.int64, nb.int64),
+          (nb.uint16[::1], nb.int64[::1], nb.int32[::1], nb.int64, nb.int64)],
+         parallel=True, nogil=True, cache=True)
+def _pl_apply(chan_sig, pl_edge_idx, pl_template, baseline, out_offset):
+    """
+    Applies baseline and template subtraction to chan_sig in place, doing the widening arithmetic
+    per element so no full-length working copy is needed. Cycles are independent, so they run
+    across cores; nogil lets this compose with the thread-pool channel parallelism.
+    """
+    n_pl = pl_edge_idx.size
+    for i in nb.prange(pl_edge_idx[0]):
+        chan_sig[i] = np.int64(chan_sig[i]) - baseline + out_offset
+    for i in nb.prange(pl_edge_idx[n_pl - 1], chan_sig.size):
+        chan_sig[i] = np.int64(chan_sig[i]) - baseline + out_offset
+    for c in nb.prange(n_pl - 1):
+        st = pl_edge_idx[c]
+        nd = pl_edge_idx[c + 1]
+        for j in range(nd - st):
+            chan_sig[st + j] = np.int64(chan_sig[st + j]) - baseline - pl_template[j] + out_offset
+
+
 def _rm_pl_i(chan_sig, pl_edge_idx):
     """
     removes pl trig signal in place.
@@ -731,59 +977,64 @@ def _rm_pl_i(chan_sig, pl_edge_idx):
     """
     n_pl = pl_edge_idx.size
     pl_len = int(np.diff(pl_edge_idx).max())
-
     sig_len = chan_sig.size
+    pl_edge_idx = np.asarray(pl_edge_idx, dtype=np.int64)
 
-    # handle unsigned integers:
-    if 'u' not in chan_sig.dtype.str:
-        result_sig = chan_sig - chan_sig.mean(dtype=chan_sig.dtype)
-    else:  # convert to int
-        dts = chan_sig.dtype.str
-        dts2 = dts[0] + "i" + dts[2]  # signed int.
-        result_sig = np.zeros(len(chan_sig), dtype=dts2)
-        # make sure we don't overflow on conversion to int from uint
-        # our conversion will be forced when we subtract int array
-        # from the uint array so we want to have some control over how this is done.
-
-        for i in range(len(chan_sig)):
-            result_sig[i] = chan_sig[i] - 32767
-
-    sig_pl = np.zeros((n_pl - 1, pl_len), dtype=result_sig.dtype)
-
-    plt.plot(result_sig[:5000])
-
-    for i, edge in enumerate(pl_edge_idx):
-        end = edge + pl_len
-        if end < sig_len:
-            sig_pl[i, :] = result_sig[edge:end]
-
-    pl_template = sig_pl.mean(axis=0).astype(result_sig.dtype)
-    pl_template -= pl_template.mean().astype(result_sig.dtype)
-
-    for i in range(n_pl - 1):
-        st = pl_edge_idx[i]
-        end = pl_edge_idx[i + 1]
-        l = end - st
-        result_sig[st:end] -= pl_template[:l]
-    if 'u' not in chan_sig.dtype.str:
-        for i in range(len(chan_sig)):
-            chan_sig[i] = result_sig[i]
-    else:
-        for i in range(len(chan_sig)):  # convert back to uint and offset in the process.
-            chan_sig[i] = result_sig[i] + 32767
+    # the uint path re-centers around the int16 midpoint; the signed path removes the signal mean.
+    unsigned = chan_sig.dtype.kind == 'u'
+    baseline = 32767 if unsigned else int(chan_sig.mean(dtype=chan_sig.dtype))
+    out_offset = 32767 if unsigned else 0
+
+    # mean PL cycle via a running int64 accumulator: no (n_cycles, pl_len) matrix and no
+    # full-length int32 copy of the signal. cycles that run off the end of the signal are
+    # excluded from the sum, but the divisor stays n_pl - 1 so the template matches the
+    # zero-row behavior of the original accumulation.
+    template_edges = pl_edge_idx[:-1]
+    template_edges = template_edges[template_edges + pl_len < sig_len]
+    acc = np.zeros(pl_len, dtype=np.int64)
+    _pl_accumulate(chan_sig, template_edges, pl_len, acc)
+    acc -= template_edges.size * baseline
+    pl_template = (acc / (n_pl - 1)).astype(np.int32)
+    pl_template -= int(pl_template.mean())
+
+    _pl_apply(chan_sig, pl_edge_idx, pl_template, baseline, out_offset)
 
 
 def _find_pl_times(pl):
     # pl = recording_matrix[:, i_pl]
     pl_threshold = np.mean(pl)
     pl_trig_log = pl > pl_threshold
-    pl_edge_detect = np.convolve([1, -1], pl_trig_log, mode='same')
-    pl_edge_idx = np.where(pl_edge_detect[1:] == 1)[0]
+    # rising edges are where the mask flips low->high; a boolean-and over shifted views replaces
+    # the O(N * k) convolution with two cheap passes and no float intermediate.
+    pl_edge_idx = np.flatnonzero(pl_trig_log[1:] & ~pl_trig_log[:-1])
     return pl_edge_idx
 
 
+def _decimate_staged(signal, downsample_factor):
+    """
+    Decimates by a large factor in stages of <= 12, as scipy recommends: one 8th-order IIR at 30x
+    is both more filter work and numerically marginal compared to e.g. 10x followed by 3x.
+
+    :param signal: 1d signal array.
+    :param downsample_factor: total (integer) downsampling factor.
+    :return: decimated signal.
+    """
+    q = int(downsample_factor)
+    while q > 12:
+        for factor in range(12, 1, -1):
+            if q % factor == 0:
+                break
+        else:
+            break  # no factor <= 12 divides q; decimate by the remainder in one shot.
+        signal = decimate(signal, factor, zero_phase=True)
+        q //= factor
+    if q > 1:
+        signal = decimate(signal, q, zero_phase=True)
+    return signal
+
+
 def _make_lfp(raw_files_prefix: str, channels, lfp_filename, acquistion_frequency, create_file=False,
-              target_freqency=1000, dtype=np.int16, expectedrows=0):
+              target_freqency=1000, dtype=np.int16, expectedrows=0, channel_data: dict=None):
     """
     Creates a decimated copy of the acquired (or processed) binary file. Only saves specific channels indicated by the
     user. Target frequency is 1kHz, but this can be adjusted as required.
@@ -796,6 +1047,8 @@ def _make_lfp(raw_files_prefix: str, channels, lfp_filename, acquistion_frequenc
     :param acquistion_frequency: Sampling frequency of the original binary file.
     :param create_file: create lfp file?
     :param target_freqency: Desired sampling frequency of the LFP copy (default is 1 kHz).
+    :param channel_data: optional {channel: array} of in-memory (or memmapped) signals to decimate
+    instead of reading per-channel binary files.
     :return:
     """
     logging.info('Making LFP for {}. Loading data...'.format(raw_files_prefix))
@@ -810,24 +1063,44 @@ def _make_lfp(raw_files_prefix: str, channels, lfp_filename, acquistion_frequenc
             n._f_setattr('Frequency_hz', lfp_freq)
             for ch in channels:
                 f.create_earray('/lfp/', 'ch_{0:04n}'.format(ch), tb.Int16Atom(), shape=(0,),
-                                expectedrows=expectedrows//downsample_factor, filters=LFP_FILTER)
+                                expectedrows=expectedrows//downsample_factor, filters=LFP_FILTER,
+                                chunkshape=LFP_CHUNKSHAPE)
     logging.info("writing LFP to {}".format(lfp_filename))
+
+    def _load_and_decimate(ch):
+        if channel_data is not None:
+            a = channel_data[ch]
+        else:
+            # memmap instead of fromfile: the filter streams through the signal once, so there's
+            # no reason to stage the whole channel in RAM first.
+            a = np.memmap(_gen_channel_fn(raw_files_prefix, ch), dtype=dtype, mode='r')
+        return _decimate_staged(a, downsample_factor)
+
+    # scipy's filters release the GIL, so channels decimate in parallel; the pytables appends are
+    # not thread-safe and stay on this thread, consumed in channel order.
     with tb.open_file(lfp_filename, 'r+') as f:
-        for ch in tqdm(channels, unit='chan', desc='LFP save'):
-            fn = _gen_channel_fn(raw_files_prefix, ch)
-            a = np.fromfile(fn, dtype=dtype)
-            b = decimate(a, downsample_factor, zero_phase=True)
-            ch_array = f.get_node('/lfp/ch_{0:04n}'.format(ch))
-            ch_array.append(b)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            decimated = ex.map(_load_and_decimate, channels)
+            for ch, b in tqdm(zip(channels, decimated), total=len(channels),
+                              unit='chan', desc='LFP save'):
+                ch_array = f.get_node('/lfp/ch_{0:04n}'.format(ch))
+                ch_array.append(b)
     logging.info('Complete.')
 
 
+def _prefix_run_key(prefix):
+    """Sort key for run file prefixes: trailing run number when present, else the prefix itself."""
+    m = re.search(r'(\d+)\D*$', prefix)
+    return (0, int(m.group(1)), prefix) if m else (1, 0, prefix)
+
+
 def make_meta_from_bins(raw_files_prefixes: Iterable, stream_channels: dict, event_channels: dict, voyeur_files: Iterable,
                         save_fn: str, acquistion_frequency: float, dtype=np.int16, debug_plots=False):
     """
     Load streams from binarys and call make_meta
     
-    :param raw_files_prefixes: path prefix to binary files.
+    :param raw_files_prefixes: path prefix to binary files. Sorted by trailing run number at
+    entry; run_ends and stream concatenation follow this order.
     :param stream_channels: dictionary of {stream_names: channel_numbers}
     :param event_channels: dictionary of {event_names: channel_numbers}
     :param voyeur_files: iterable 
@@ -837,41 +1110,129 @@ def make_meta_from_bins(raw_files_prefixes: Iterable, stream_channels: dict, eve
     :param debug_plots:
     :return:
     """
+    # run order determines run_ends and stream concatenation, and in-number-order reads keep
+    # the disk access pattern sequential; sort once here instead of trusting the caller.
+    raw_files_prefixes = sorted(raw_files_prefixes, key=_prefix_run_key)
     ch = 1  # in case we have no specified channels we'll read from channel 1...
     logging.info("Loading stream and event arrays from dats.".format(save_fn))
     streams = defaultdict(list)
     events = defaultdict(list)
+    # memmap the per-channel binaries: make_meta writes the run chunks itself, so reading them
+    # into RAM here would copy every stream twice. run sizes fall out of the same pass, so
+    # make_meta doesn't have to rederive them from whichever dict happens to be non-empty.
+    run_sizes = None
     for name, ch in stream_channels.items():
         for prefix in raw_files_prefixes:
             fn = _gen_channel_fn(prefix, ch)
-            a = np.fromfile(fn, dtype)
-            streams[name].append(a)
+            streams[name].append(_memmap_willneed(fn, dtype))
+        if run_sizes is None:
+            run_sizes = [len(x) for x in streams[name]]
+    # event detectors need one flat array per channel, so multi-run channels are read with
+    # readinto straight into slices of a single presized buffer — no per-run arrays and no
+    # concatenate pass. single runs stay memmapped and uncopied.
+    # detection across event channels is independent, so with several channels (and no debug
+    # plotting) each runs on its own worker thread, reading its own files; the detector kernels
+    # are nogil so the threads genuinely overlap, and the HDF5 writes stay serialized in
+    # make_meta on this thread.
+    parallel_detect = not debug_plots and len(event_channels) > 1
+    itemsize = np.dtype(dtype).itemsize
+    # sample dtypes have power-of-two itemsizes, so byte counts convert to sample counts with
+    # one vectorized shift rather than a division per run.
+    size_shift = itemsize.bit_length() - 1 if itemsize & (itemsize - 1) == 0 else None
     for name, ch in event_channels.items():
-        for prefix in raw_files_prefixes:
-            fn = _gen_channel_fn(prefix, ch)
-            a = np.fromfile(fn, dtype)
-            events[name].append(a)
+        fns = [_gen_channel_fn(prefix, ch) for prefix in raw_files_prefixes]
+        sizes = _sizes_by_scandir(fns)
+        if run_sizes is None:
+            if size_shift is not None:
+                run_sizes = (np.asarray(sizes, dtype=np.uint64) >> np.uint64(size_shift)).tolist()
+            else:
+                run_sizes = [sz // itemsize for sz in sizes]
+        if parallel_detect:
+            continue  # the worker loads the channel itself.
+        if len(fns) == 1:
+            events[name].append(_memmap_willneed(fns[0], dtype))
+        else:
+            flat = np.empty(sum(sizes) // itemsize, dtype=dtype)
+            view = memoryview(flat).cast('B')
+            pos = 0
+            for fn, sz in zip(fns, sizes):
+                with open(fn, 'rb', buffering=0) as fh:
+                    _readinto_full(fh, view[pos:pos + sz])
+                pos += sz
+            events[name].append(flat)
+
+    precomputed_events = None
+    if parallel_detect:
+        logging.info('Detecting events for {} channels in parallel.'.format(len(event_channels)))
+        dtype_str = np.dtype(dtype).str
+        with ThreadPoolExecutor(max_workers=min(len(event_channels), os.cpu_count() or 1)) as ex:
+            futures = [ex.submit(_detect_events, name,
+                                 [_gen_channel_fn(p, ch) for p in raw_files_prefixes],
+                                 dtype_str, acquistion_frequency)
+                       for name, ch in event_channels.items()]
+            precomputed_events = dict(fut.result() for fut in as_completed(futures))
+
+    return make_meta(streams, events, voyeur_files, save_fn, acquistion_frequency, debug_plots,
+                     run_sizes=run_sizes, precomputed_events=precomputed_events)
+
+
+def _detect_events(name, fns, dtype_str, acquisition_frequency):
+    """
+    Worker: memmaps an event channel's per-run binaries, flattens them, and runs the channel's
+    detector (a nogil kernel, so worker threads overlap). Returns (name, detected events).
+    """
+    chunks = [np.memmap(fn, dtype=np.dtype(dtype_str), mode='r') for fn in fns]
+    return name, meta_handlers.processors[name](_flatten_chunks(chunks), acquisition_frequency)
 
-    return make_meta(streams, events, voyeur_files, save_fn, acquistion_frequency, debug_plots)
+
+def _memmap_willneed(fn, dtype):
+    """
+    Read-only memmap of fn with a POSIX_FADV_WILLNEED hint, so the kernel starts readahead
+    before the first page fault instead of on it.
+    """
+    mm = np.memmap(fn, dtype=dtype, mode='r')
+    if hasattr(os, 'posix_fadvise'):
+        fd = os.open(fn, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    return mm
+
+
+def _flatten_chunks(chunks):
+    """
+    Returns the single run chunk uncopied, or the concatenation for multi-run recordings.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
 
 
 def make_meta(streams: Dict, events: Dict, voyeur_files: Iterable, save_fn: str, acquistion_frequency: float,
-              debug_plots=False):
+              debug_plots=False, run_sizes=None, precomputed_events=None):
     """
-    Generalized meta file maker that takes pre-loaded streams and arrays. Data arrays should be a list of arrays: 
+    Generalized meta file maker that takes pre-loaded streams and arrays. Data arrays should be a list of arrays:
     ie [stream_run_1, stream_run_2, ...].
-    
+
     :param streams: dictionary of arrays to save as streams. Arrays will be saved to the Streams node of meta file.
-    :param events: dictionary of arrays from which to extract events. 
+    :param events: dictionary of arrays from which to extract events.
     :param voyeur_files: iterable containg
-    :param save_fn: 
-    :param acquisition_frequency: 
-    :param debug_plots: 
-    :return: 
+    :param save_fn:
+    :param acquisition_frequency:
+    :param debug_plots:
+    :param run_sizes: optional list of per-run sample counts; derived from the first stream or
+    event entry when not given.
+    :param precomputed_events: optional {name: detected array} already run through a processor
+    (e.g. in worker processes); written to /Events as-is.
+    :return:
     """
 
-    n_runs = 0
-    run_sizes = []
+    if run_sizes:
+        n_runs = len(run_sizes)
+    else:
+        n_runs = 0
+        run_sizes = []
     logging.info("Making meta HDF5 file {}".format(save_fn))
     with tb.open_file(save_fn, 'w') as f:
         assert isinstance(f, tb.File)
@@ -892,36 +1253,71 @@ def make_meta(streams: Dict, events: Dict, voyeur_files: Iterable, save_fn: str,
                 n_runs = len(stream_chunks)
                 run_sizes = [len(x) for x in stream_chunks]
             logging.info('Writing stream {}'.format(name))
-            stream = np.concatenate(stream_chunks)
             if debug_plots:
-                plt.plot(stream[:STREAM_PLOT_NSAMP])
-                plt.title(name)
-                plt.show()
-            f.create_carray('/Streams', name, createparents=True, obj=stream, filters=STREAM_FILTER)
-        for name, stream_chunks in events.items():
-            if not n_runs:
-                n_runs = len(stream_chunks)
-                run_sizes = [len(x) for x in stream_chunks]
-            logging.info('Making events for {}.'.format(name))
-            stream = np.concatenate(stream_chunks)
-            if debug_plots:
-                plt.plot(stream[:EVENT_PLOT_NSAMP])
-                plt.title(name)
-                plt.show()
-            events = meta_handlers.processors[name](stream, acquistion_frequency)
-            f.create_carray('/Events', name, createparents=True, obj=events)
+                plt = _plt()
+                stride = max(1, STREAM_PLOT_NSAMP // MAX_PLOT_PTS)
+                plt.plot(stream_chunks[0][:STREAM_PLOT_NSAMP:stride])
+                _save_debug_plot(plt, name)
+            # run chunks are written straight into a presized carray, so the concatenated stream
+            # never needs to exist in RAM (the chunks are usually memmaps).
+            total = sum(len(x) for x in stream_chunks)
+            ca = f.create_carray('/Streams', name, createparents=True, shape=(total,),
+                                 atom=tb.Atom.from_dtype(np.dtype(stream_chunks[0].dtype)),
+                                 filters=STREAM_FILTER)
+            offset = 0
+            for chunk in stream_chunks:
+                ca[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+        # event detection alternates big sequential reads with jitted compute, so a one-worker
+        # prefetcher flattens (and thereby pages in) the next stream while the current one is
+        # being scanned.
+        event_items = list(events.items())
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            pending = prefetch.submit(_flatten_chunks, event_items[0][1]) if event_items else None
+            for i, (name, stream_chunks) in enumerate(event_items):
+                if not n_runs:
+                    n_runs = len(stream_chunks)
+                    run_sizes = [len(x) for x in stream_chunks]
+                logging.info('Making events for {}.'.format(name))
+                stream = pending.result()
+                if i + 1 < len(event_items):
+                    pending = prefetch.submit(_flatten_chunks, event_items[i + 1][1])
+                if debug_plots:
+                    plt = _plt()
+                    stride = max(1, EVENT_PLOT_NSAMP // MAX_PLOT_PTS)
+                    plt.plot(stream[:EVENT_PLOT_NSAMP:stride])
+                    _save_debug_plot(plt, name)
+                detected = meta_handlers.processors[name](stream, acquistion_frequency)
+                _event_carray(f, name, detected)
+        if precomputed_events:
+            for name, detected in precomputed_events.items():
+                logging.info('Writing precomputed events for {}.'.format(name))
+                _event_carray(f, name, detected)
         if run_sizes:
-            run_ends = np.zeros(len(run_sizes), dtype=np.uint64)
-            cv = 0
-            for i, v in enumerate(run_sizes):
-                cv += v
-                run_ends[i] = cv
-            f.create_carray('/Events', 'run_ends', obj=run_ends, title='run end samples.')
+            run_ends = np.cumsum(np.asarray(run_sizes, dtype=np.uint64))
+            # run_ends is a few dozen bytes; contiguous storage skips the chunk B-tree entirely.
+            f.create_array('/Events', 'run_ends', obj=run_ends, title='run end samples.',
+                           createparents=True)
 
 
-def _get_number(path, ch_prefix):
+def _event_carray(f, name, detected, **kwargs):
+    """
+    Writes a detected-event array to /Events with explicit compression and chunking instead of
+    the PyTables defaults, which are a poor fit for small index tables. The full shape is known
+    here (obj carries it), so the dataset is created at final size and never regrown.
+    """
+    arr = np.asarray(detected)
+    chunkshape = (min(arr.shape[0], EVENT_CHUNK_ROWS),) + arr.shape[1:] if arr.shape[0] else None
+    return f.create_carray('/Events', name, createparents=True, obj=arr,
+                           filters=EVENT_FILTERS, chunkshape=chunkshape, **kwargs)
+
+
+_NUM_RE_CACHE = {}  # {ch_prefix: compiled pattern}; one pattern per prefix, reused across file scans.
 
-    d, f = os.path.split(path)
-    n, e = os.path.splitext(f)
-    p, ch = n.split(ch_prefix)
-    return int(ch)
\ No newline at end of file
+
+def _get_number(path, ch_prefix):
+    try:
+        pattern = _NUM_RE_CACHE[ch_prefix]
+    except KeyError:
+        pattern = _NUM_RE_CACHE[ch_prefix] = re.compile(re.escape(ch_prefix) + r'(\d+)')
+    return int(pattern.search(os.path.basename(path)).group(1))
\ No newline at end of file